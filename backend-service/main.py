@@ -4,38 +4,109 @@ This service handles business logic and integrates with LiteLLM and Vertex AI
 """
 
 import os
+import sys
+import atexit
 import logging
+import threading
 import asyncio
+import time
 from typing import Dict, Any, Optional, List
 from datetime import datetime
 import json
+import functools
+import itertools
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, HTTPException, Depends, Request, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
 import httpx
+import orjson
 import structlog
 from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
 from google.cloud import aiplatform
 from google.auth import default
+from vertexai.preview.generative_models import GenerativeModel
+
+# Configuration
+LOG_LEVELS = ("CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG")
+
+def _resolve_log_level(name: str) -> str:
+    """Normalize a LOG_LEVEL value to a standard level name, defaulting to INFO"""
+    level = logging.getLevelName(name.upper())
+    canonical = logging.getLevelName(level) if isinstance(level, int) else None
+    return canonical if canonical in LOG_LEVELS else "INFO"
+
+class Settings:
+    def __init__(self):
+        self.port = int(os.getenv("PORT", "8080"))
+        self.litellm_url = os.getenv("LITELLM_URL", "http://litellm-service:4000")
+        self.vertex_ai_project = os.getenv("VERTEX_AI_PROJECT", "")
+        self.vertex_ai_region = os.getenv("VERTEX_AI_REGION", "us-central1")
+        self.log_level = _resolve_log_level(os.getenv("LOG_LEVEL", "INFO"))
+        self.environment = os.getenv("ENVIRONMENT", "production")
+
+settings = Settings()
+
+# Buffered stdout for log lines
+class BufferedLogStream:
+    """Byte stream for log output that only hits stdout when drained"""
+
+    def __init__(self, buffer_size: int = 4096):
+        self._buffer_size = buffer_size
+        self._pending = bytearray()
+        self._lock = threading.Lock()
+
+    def write(self, data: bytes) -> int:
+        with self._lock:
+            self._pending += data
+            full = len(self._pending) >= self._buffer_size
+        if full:
+            self.drain()
+        return len(data)
+
+    def flush(self) -> None:
+        # BytesLogger flushes after every line; defer to drain() instead
+        pass
+
+    def drain(self) -> None:
+        with self._lock:
+            if not self._pending:
+                return
+            data = bytes(self._pending)
+            self._pending.clear()
+        # Resolve stdout at write time so redirections are honoured
+        stdout = sys.stdout
+        stdout.flush()
+        binary = getattr(stdout, "buffer", None)
+        if binary is not None:
+            binary.write(data)
+            binary.flush()
+        else:
+            stdout.write(data.decode())
+            stdout.flush()
+
+log_stream = BufferedLogStream()
+atexit.register(log_stream.drain)
+
+async def flush_logs_periodically(interval: float = 0.05):
+    """Drain buffered log lines to stdout every `interval` seconds"""
+    while True:
+        await asyncio.sleep(interval)
+        log_stream.drain()
 
 # Configure structured logging
 structlog.configure(
     processors=[
-        structlog.stdlib.filter_by_level,
-        structlog.stdlib.add_logger_name,
-        structlog.stdlib.add_log_level,
-        structlog.stdlib.PositionalArgumentsFormatter(),
-        structlog.processors.TimeStamper(fmt="iso"),
-        structlog.processors.StackInfoRenderer(),
-        structlog.processors.format_exc_info,
-        structlog.processors.UnicodeDecoder(),
-        structlog.processors.JSONRenderer()
+        structlog.processors.TimeStamper(fmt="iso", utc=True),
+        structlog.processors.add_log_level,
+        structlog.processors.JSONRenderer(serializer=orjson.dumps)
     ],
     context_class=dict,
-    logger_factory=structlog.stdlib.LoggerFactory(),
-    wrapper_class=structlog.stdlib.BoundLogger,
+    logger_factory=structlog.BytesLoggerFactory(file=log_stream),
+    wrapper_class=structlog.make_filtering_bound_logger(getattr(logging, settings.log_level)),
     cache_logger_on_first_use=True,
 )
 
@@ -47,18 +118,6 @@ REQUEST_DURATION = Histogram('backend_request_duration_seconds', 'Request durati
 LITELLM_REQUESTS = Counter('litellm_requests_total', 'LiteLLM requests', ['model', 'status'])
 VERTEX_AI_REQUESTS = Counter('vertex_ai_requests_total', 'Vertex AI requests', ['model', 'status'])
 
-# Configuration
-class Settings:
-    def __init__(self):
-        self.port = int(os.getenv("PORT", "8080"))
-        self.litellm_url = os.getenv("LITELLM_URL", "http://litellm-service:4000")
-        self.vertex_ai_project = os.getenv("VERTEX_AI_PROJECT", "")
-        self.vertex_ai_region = os.getenv("VERTEX_AI_REGION", "us-central1")
-        self.log_level = os.getenv("LOG_LEVEL", "INFO")
-        self.environment = os.getenv("ENVIRONMENT", "production")
-
-settings = Settings()
-
 # Pydantic models
 class ChatRequest(BaseModel):
     message: str = Field(..., description="User message")
@@ -68,6 +127,9 @@ class ChatRequest(BaseModel):
     system_prompt: Optional[str] = Field(default=None, description="System prompt")
     conversation_id: Optional[str] = Field(default=None, description="Conversation ID")
 
+class LiteLLMChatRequest(ChatRequest):
+    stream: bool = Field(default=False, description="Stream the response as server-sent events")
+
 class ChatResponse(BaseModel):
     response: str
     model: str
@@ -88,13 +150,39 @@ class ErrorResponse(BaseModel):
     timestamp: datetime
     request_id: Optional[str] = None
 
+# Application lifespan
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create the shared LiteLLM HTTP client on startup and close it on shutdown"""
+    log_flusher = asyncio.create_task(flush_logs_periodically())
+    _prebind_request_counters(app)
+    logger.info("Backend service starting up", port=settings.port)
+    app.state.http_client = httpx.AsyncClient(
+        timeout=httpx.Timeout(connect=5.0, read=60.0, write=10.0, pool=5.0),
+        limits=httpx.Limits(
+            max_connections=200,
+            max_keepalive_connections=100,
+            keepalive_expiry=30.0
+        )
+    )
+    try:
+        yield
+    finally:
+        logger.info("Backend service shutting down")
+        await app.state.http_client.aclose()
+        log_flusher.cancel()
+        log_stream.drain()
+
 # FastAPI app
 app = FastAPI(
     title="AI Gateway Backend Service",
     description="Backend service for AI Gateway with LiteLLM and Vertex AI integration",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=ORJSONResponse,
+    responses={"4XX": {"model": ErrorResponse}, "5XX": {"model": ErrorResponse}},
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -107,7 +195,9 @@ app.add_middleware(
 )
 
 # HTTP client
-http_client = httpx.AsyncClient(timeout=30.0)
+def get_http_client(request: Request) -> httpx.AsyncClient:
+    """Return the long-lived HTTP client created in the application lifespan"""
+    return request.app.state.http_client
 
 # Vertex AI client
 try:
@@ -118,40 +208,102 @@ except Exception as e:
     logger.warning("Vertex AI initialization failed", error=str(e))
     vertex_ai_available = False
 
+@functools.lru_cache(maxsize=16)
+def _get_vertex_model(name: str) -> GenerativeModel:
+    """Return a cached GenerativeModel instance for the given model name"""
+    return GenerativeModel(name)
+
+# Probe and scrape endpoints that skip request logging and metrics
+UNTRACKED_PATHS = frozenset({"/metrics", "/ready", "/health"})
+
+# Metric label helpers
+def _route_label(request: Request) -> str:
+    """Return the matched route template so metric labels stay bounded"""
+    route = request.scope.get("route")
+    if route is not None:
+        return route.path
+    # Plain Starlette routes (docs, OpenAPI schema) only record their endpoint
+    endpoint = request.scope.get("endpoint")
+    if endpoint is not None:
+        for route in request.app.routes:
+            if getattr(route, "endpoint", None) is endpoint:
+                return route.path
+    return "unmatched"
+
+KNOWN_METHODS = frozenset({"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"})
+
+def _method_label(method: str) -> str:
+    """Map client-supplied HTTP methods onto a fixed set of label values"""
+    return method if method in KNOWN_METHODS else "OTHER"
+
+def _status_class(status_code: int) -> str:
+    """Bucket an HTTP status code into 2xx/3xx/4xx/5xx"""
+    return f"{status_code // 100}xx"
+
+# Pre-bound REQUEST_COUNT children keyed by (method, endpoint, status)
+STATUS_CLASSES = ("2xx", "3xx", "4xx", "5xx")
+_request_counters: Dict[tuple, Any] = {}
+
+def _prebind_request_counters(app: FastAPI) -> None:
+    """Resolve REQUEST_COUNT children for every registered API route up front"""
+    for route in app.routes:
+        if not isinstance(route, APIRoute) or route.path in UNTRACKED_PATHS:
+            continue
+        for method in route.methods:
+            for status in STATUS_CLASSES:
+                _request_counters[(method, route.path, status)] = REQUEST_COUNT.labels(
+                    method=method, endpoint=route.path, status=status
+                )
+
+def _count_request(method: str, endpoint: str, status: str) -> None:
+    """Increment REQUEST_COUNT, binding unseen label combinations on demand"""
+    key = (method, endpoint, status)
+    counter = _request_counters.get(key)
+    if counter is None:
+        counter = _request_counters[key] = REQUEST_COUNT.labels(
+            method=method, endpoint=endpoint, status=status
+        )
+    counter.inc()
+
+# Request ID generation (unique within a process, prefixed by its PID)
+_request_counter = itertools.count()
+_pid = os.getpid()
+
 # Middleware for request logging and metrics
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    start_time = asyncio.get_event_loop().time()
+    if request.url.path in UNTRACKED_PATHS:
+        return await call_next(request)
+    
+    start_time = time.perf_counter()
+    method = request.method
+    url = str(request.url)
     
     # Generate request ID
-    request_id = f"req_{int(start_time * 1000000)}"
+    request_id = f"req_{_pid}_{next(_request_counter):x}"
     
     # Log request
     logger.info(
         "Request started",
-        method=request.method,
-        url=str(request.url),
+        method=method,
+        url=url,
         request_id=request_id,
         client_ip=request.client.host if request.client else None
     )
     
     try:
         response = await call_next(request)
-        processing_time = asyncio.get_event_loop().time() - start_time
+        processing_time = time.perf_counter() - start_time
         
         # Update metrics
-        REQUEST_COUNT.labels(
-            method=request.method,
-            endpoint=request.url.path,
-            status=response.status_code
-        ).inc()
+        _count_request(_method_label(method), _route_label(request), _status_class(response.status_code))
         REQUEST_DURATION.observe(processing_time)
         
         # Log response
         logger.info(
             "Request completed",
-            method=request.method,
-            url=str(request.url),
+            method=method,
+            url=url,
             status_code=response.status_code,
             processing_time=processing_time,
             request_id=request_id
@@ -163,36 +315,31 @@ async def log_requests(request: Request, call_next):
         return response
         
     except Exception as e:
-        processing_time = asyncio.get_event_loop().time() - start_time
+        processing_time = time.perf_counter() - start_time
         
         logger.error(
             "Request failed",
-            method=request.method,
-            url=str(request.url),
+            method=method,
+            url=url,
             error=str(e),
             processing_time=processing_time,
             request_id=request_id
         )
         
-        REQUEST_COUNT.labels(
-            method=request.method,
-            endpoint=request.url.path,
-            status=500
-        ).inc()
+        _count_request(_method_label(method), _route_label(request), _status_class(500))
         
         raise
 
 # Health check endpoints
 @app.get("/health", response_model=HealthResponse)
-async def health_check():
+async def health_check(http_client: httpx.AsyncClient = Depends(get_http_client)):
     """Health check endpoint"""
     services = {}
     
     # Check LiteLLM
     try:
-        async with http_client as client:
-            response = await client.get(f"{settings.litellm_url}/health", timeout=5.0)
-            services["litellm"] = "healthy" if response.status_code == 200 else "unhealthy"
+        response = await http_client.get(f"{settings.litellm_url}/health", timeout=5.0)
+        services["litellm"] = "healthy" if response.status_code == 200 else "unhealthy"
     except Exception:
         services["litellm"] = "unhealthy"
     
@@ -214,78 +361,113 @@ async def readiness_check():
 @app.get("/metrics")
 async def metrics():
     """Prometheus metrics endpoint"""
-    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+    return Response(content=generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+# Streaming relay
+async def relay_litellm_stream(response: httpx.Response, model: str):
+    """Yield decoded LiteLLM stream chunks, always releasing the upstream connection"""
+    try:
+        async for chunk in response.aiter_bytes():
+            yield chunk
+        LITELLM_REQUESTS.labels(model=model, status="success").inc()
+    except httpx.TimeoutException as e:
+        LITELLM_REQUESTS.labels(model=model, status="timeout").inc()
+        logger.error("Chat stream timed out", error=str(e), model=model)
+        raise
+    except Exception as e:
+        LITELLM_REQUESTS.labels(model=model, status="error").inc()
+        logger.error("Chat stream failed", error=str(e), model=model)
+        raise
+    finally:
+        await response.aclose()
 
 # Chat endpoint
-@app.post("/api/v1/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest, background_tasks: BackgroundTasks):
+@app.post("/api/v1/chat", responses={200: {"model": ChatResponse}})
+async def chat(
+    request: LiteLLMChatRequest,
+    http_client: httpx.AsyncClient = Depends(get_http_client)
+):
     """
     Process chat request through LiteLLM
     """
-    start_time = asyncio.get_event_loop().time()
+    start_time = time.perf_counter()
     
     try:
-        # Prepare request for LiteLLM
+        # Prepare request for LiteLLM, system prompt first if provided
+        messages = (
+            [{"role": "system", "content": request.system_prompt}]
+            if request.system_prompt else []
+        )
+        messages.append({"role": "user", "content": request.message})
         litellm_request = {
             "model": request.model,
-            "messages": [
-                {"role": "user", "content": request.message}
-            ],
+            "messages": messages,
             "temperature": request.temperature,
             "max_tokens": request.max_tokens
         }
+        if request.stream:
+            litellm_request["stream"] = True
         
-        # Add system prompt if provided
-        if request.system_prompt:
-            litellm_request["messages"].insert(0, {
-                "role": "system", 
-                "content": request.system_prompt
-            })
+        # Call LiteLLM with a pre-serialized body
+        litellm_call = http_client.build_request(
+            "POST",
+            f"{settings.litellm_url}/chat/completions",
+            content=orjson.dumps(litellm_request),
+            headers={"Content-Type": "application/json"}
+        )
+        response = await http_client.send(litellm_call, stream=request.stream)
         
-        # Call LiteLLM
-        async with http_client as client:
-            response = await client.post(
-                f"{settings.litellm_url}/chat/completions",
-                json=litellm_request,
-                headers={"Content-Type": "application/json"},
-                timeout=60.0
-            )
-            
+        if request.stream:
             if response.status_code != 200:
-                LITELLM_REQUESTS.labels(model=request.model, status="error").inc()
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"LiteLLM error: {response.text}"
+                await response.aread()
+                await response.aclose()
+            else:
+                logger.info(
+                    "Chat stream started",
+                    model=request.model,
+                    user_message_length=len(request.message),
+                    processing_time=time.perf_counter() - start_time
+                )
+                return StreamingResponse(
+                    relay_litellm_stream(response, request.model),
+                    media_type="text/event-stream"
                 )
-            
-            result = response.json()
-            LITELLM_REQUESTS.labels(model=request.model, status="success").inc()
         
-        processing_time = asyncio.get_event_loop().time() - start_time
+        if response.status_code != 200:
+            LITELLM_REQUESTS.labels(model=request.model, status="error").inc()
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=f"LiteLLM error: {response.text}"
+            )
+        
+        result = orjson.loads(response.content)
+        LITELLM_REQUESTS.labels(model=request.model, status="success").inc()
+        
+        processing_time = time.perf_counter() - start_time
         
         # Extract response
         ai_response = result["choices"][0]["message"]["content"]
         tokens_used = result.get("usage", {}).get("total_tokens")
         
         # Log successful request
-        background_tasks.add_task(
-            log_chat_request,
-            request.model,
-            request.message,
-            ai_response,
-            processing_time,
-            tokens_used
-        )
-        
-        return ChatResponse(
-            response=ai_response,
+        logger.info(
+            "Chat request processed",
             model=request.model,
-            tokens_used=tokens_used,
-            conversation_id=request.conversation_id,
-            timestamp=datetime.utcnow(),
-            processing_time=processing_time
+            user_message_length=len(request.message),
+            ai_response_length=len(ai_response),
+            processing_time=processing_time,
+            tokens_used=tokens_used
         )
         
+        return ORJSONResponse({
+            "response": ai_response,
+            "model": request.model,
+            "tokens_used": tokens_used,
+            "conversation_id": request.conversation_id,
+            "timestamp": datetime.utcnow(),
+            "processing_time": processing_time
+        })
+        
     except httpx.TimeoutException:
         LITELLM_REQUESTS.labels(model=request.model, status="timeout").inc()
         raise HTTPException(status_code=504, detail="Request timeout")
@@ -298,7 +480,7 @@ async def chat(request: ChatRequest, background_tasks: BackgroundTasks):
         raise HTTPException(status_code=500, detail="Internal server error")
 
 # Direct Vertex AI endpoint
-@app.post("/api/v1/vertex-ai/chat")
+@app.post("/api/v1/vertex-ai/chat", responses={200: {"model": ChatResponse}})
 async def vertex_ai_chat(request: ChatRequest):
     """
     Direct Vertex AI integration (bypass LiteLLM)
@@ -306,16 +488,14 @@ async def vertex_ai_chat(request: ChatRequest):
     if not vertex_ai_available:
         raise HTTPException(status_code=503, detail="Vertex AI not available")
     
-    start_time = asyncio.get_event_loop().time()
+    start_time = time.perf_counter()
     
     try:
-        from vertexai.preview.generative_models import GenerativeModel
-        
-        # Initialize model
-        model = GenerativeModel(request.model)
+        model = _get_vertex_model(request.model)
         
-        # Generate response
-        response = model.generate_content(
+        # Generate response off the event loop; the SDK call is blocking
+        response = await asyncio.to_thread(
+            model.generate_content,
             request.message,
             generation_config={
                 "temperature": request.temperature,
@@ -323,17 +503,17 @@ async def vertex_ai_chat(request: ChatRequest):
             }
         )
         
-        processing_time = asyncio.get_event_loop().time() - start_time
+        processing_time = time.perf_counter() - start_time
         VERTEX_AI_REQUESTS.labels(model=request.model, status="success").inc()
         
-        return ChatResponse(
-            response=response.text,
-            model=request.model,
-            tokens_used=None,  # Vertex AI doesn't provide token count in this format
-            conversation_id=request.conversation_id,
-            timestamp=datetime.utcnow(),
-            processing_time=processing_time
-        )
+        return ORJSONResponse({
+            "response": response.text,
+            "model": request.model,
+            "tokens_used": None,  # Vertex AI doesn't provide token count in this format
+            "conversation_id": request.conversation_id,
+            "timestamp": datetime.utcnow(),
+            "processing_time": processing_time
+        })
         
     except Exception as e:
         VERTEX_AI_REQUESTS.labels(model=request.model, status="error").inc()
@@ -342,70 +522,46 @@ async def vertex_ai_chat(request: ChatRequest):
 
 # Models endpoint
 @app.get("/api/v1/models")
-async def list_models():
+async def list_models(http_client: httpx.AsyncClient = Depends(get_http_client)):
     """
     List available models from LiteLLM
     """
     try:
-        async with http_client as client:
-            response = await client.get(f"{settings.litellm_url}/models")
-            if response.status_code == 200:
-                return response.json()
-            else:
-                raise HTTPException(status_code=502, detail="Failed to fetch models")
+        response = await http_client.get(f"{settings.litellm_url}/models")
+        if response.status_code == 200:
+            return orjson.loads(response.content)
+        else:
+            raise HTTPException(status_code=502, detail="Failed to fetch models")
     except Exception as e:
         logger.error("Failed to fetch models", error=str(e))
         raise HTTPException(status_code=500, detail="Internal server error")
 
-# Background task for logging
-async def log_chat_request(model: str, user_message: str, ai_response: str, 
-                          processing_time: float, tokens_used: Optional[int]):
-    """Log chat request details"""
-    logger.info(
-        "Chat request processed",
-        model=model,
-        user_message_length=len(user_message),
-        ai_response_length=len(ai_response),
-        processing_time=processing_time,
-        tokens_used=tokens_used
-    )
-
-# Error handlers
+# Error handlers (payloads follow the ErrorResponse schema)
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=exc.status_code,
-        content=ErrorResponse(
-            error=f"HTTP {exc.status_code}",
-            message=exc.detail,
-            timestamp=datetime.utcnow(),
-            request_id=request.headers.get("X-Request-ID")
-        ).dict()
+        content={
+            "error": f"HTTP {exc.status_code}",
+            "message": exc.detail,
+            "timestamp": datetime.utcnow().isoformat(),
+            "request_id": request.headers.get("X-Request-ID")
+        }
     )
 
 @app.exception_handler(Exception)
 async def general_exception_handler(request: Request, exc: Exception):
     logger.error("Unhandled exception", error=str(exc), path=request.url.path)
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
-        content=ErrorResponse(
-            error="Internal Server Error",
-            message="An unexpected error occurred",
-            timestamp=datetime.utcnow(),
-            request_id=request.headers.get("X-Request-ID")
-        ).dict()
+        content={
+            "error": "Internal Server Error",
+            "message": "An unexpected error occurred",
+            "timestamp": datetime.utcnow().isoformat(),
+            "request_id": request.headers.get("X-Request-ID")
+        }
     )
 
-# Startup and shutdown events
-@app.on_event("startup")
-async def startup_event():
-    logger.info("Backend service starting up", port=settings.port)
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    logger.info("Backend service shutting down")
-    await http_client.aclose()
-
 # Main entry point
 if __name__ == "__main__":
     import uvicorn